@@ -2,18 +2,35 @@
 Telegram-бот для трекинга воды, калорий и тренировок
 """
 
+import time
+BOOT_STARTED = time.perf_counter()
+
+import asyncio
+import json
 import logging
+import os
+import pickle
+import sys
+from collections import deque
+from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     ConversationHandler,
+    BaseUpdateProcessor,
     filters,
     ContextTypes
 )
-import requests
-from config import TELEGRAM_TOKEN, WEATHER_API_KEY, WEATHER_API_URL
+from config import (
+    BOT_TOKENS, WEATHER_API_KEY, WEATHER_API_URL, FOOD_API_URL, ADMIN_IDS,
+    DATA_SNAPSHOT_PATH, BOT_WORKERS, SHARED_STORE_PATH
+)
+from shared_store import SharedStore
+
+# Редкие пути (csv, tempfile) импортируются лениво — не тратим на них время старта
+IMPORTS_DONE = time.perf_counter()
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -21,13 +38,54 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Хранилище данных
-users_data = {}
+# Хранилище данных: у каждого бота своё, context.bot_data['users_data']
+
+# Общий на процесс пул HTTP-соединений для внешних API
+http_client = None
+http_client_users = 0
+HTTP_POOL_SIZE = 20
+
+# Общее хранилище процессов (открывается в main / в процессе-обработчике)
+shared_store = None
+WEATHER_CACHE_TTL = 600        # сек
+FOOD_CACHE_TTL = 24 * 3600     # сек
+WEATHER_API_RATE = 1.0         # запросов в секунду на все процессы
+FOOD_API_RATE = 10 / 60        # Open Food Facts просит не больше 10 поисков в минуту
+API_BURST = 5
+
+# Быстрый старт
+SNAPSHOT_INTERVAL = 60     # как часто сохранять снапшот данных (сек)
+# Нужны только экспорту/импорту; это несколько мс — основное время старта
+# уходит на импорт telegram и httpx, без них бот не работает
+WARM_UP_MODULES = ('csv', 'tempfile')
+startup_timings = {}
 
 # Состояния для диалогов
 WEIGHT, HEIGHT, AGE, ACTIVITY, CITY, GENDER = range(6)
 FOOD_AMOUNT = 100
 
+# Экспорт / импорт истории
+HISTORY_FIELDS = ['user_id', 'time', 'type', 'name', 'amount', 'calories']
+HISTORY_TYPES = ('water', 'food', 'workout')
+EXPORT_FORMATS = {'csv': 'csv', 'json': 'jsonl'}
+IMPORT_BATCH_SIZE = 500
+
+# Контроль нагрузки
+USER_RATE = 1.0            # токенов в секунду на пользователя
+USER_BURST = 5             # запас токенов для коротких всплесков
+MAX_USER_PENDING = 2       # обновлений одного пользователя в работе и в ожидании
+MAX_ACTIVE = 8             # одновременно выполняемых тяжёлых обновлений
+MAX_WAITING = 32           # тяжёлых обновлений в очереди за свободным слотом
+MAX_WAIT_SECONDS = 5       # сколько обновление может ждать слот
+CHEAP_RESERVE = 16         # места для лёгких команд сверх тяжёлой работы
+SHED_NOTICE_INTERVAL = 10  # не чаще раза в N секунд пишем "попробуй позже"
+SHED_NOTICE_RATE = 5       # ответов "попробуй позже" в секунду на всех
+SHED_NOTICE_BURST = 20     # запас таких ответов для всплеска
+SWEEP_INTERVAL = 60        # как часто чистим полные корзины и старые отметки (сек)
+UPDATE_QUEUE_SIZE = 100    # очередь между получением обновлений и допуском
+CHEAP_COMMANDS = {'/start', '/help', '/check_progress', '/cancel', '/metrics', '/bots'}
+CHEAP_BUTTONS = {"📊 Мой прогресс", "❓ Помощь"}
+
 # Типы тренировок и калории
 WORKOUT_CALORIES = {
     'бег': 10, 'ходьба': 4, 'плавание': 8, 'велосипед': 7, 'йога': 3,
@@ -93,13 +151,57 @@ def get_main_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-def get_weather(city):
+def acquire_http_client():
+    """Общий пул соединений: один на процесс, для всех ботов"""
+    global http_client, http_client_users
+    if http_client is None:
+        import httpx
+        http_client = httpx.AsyncClient(
+            timeout=5, limits=httpx.Limits(max_connections=HTTP_POOL_SIZE)
+        )
+    http_client_users += 1
+    return http_client
+
+async def release_http_client():
+    """Закрывает пул, когда его больше не использует ни один бот"""
+    global http_client, http_client_users
+    http_client_users -= 1
+    if http_client_users <= 0 and http_client is not None:
+        await http_client.aclose()
+        http_client, http_client_users = None, 0
+
+async def cache_get(key):
+    if shared_store is None:
+        return None
+    return await asyncio.to_thread(shared_store.get, key)
+
+async def cache_set(key, value, ttl):
+    if shared_store is not None:
+        await asyncio.to_thread(shared_store.set, key, value, ttl)
+
+async def api_allowed(name, rate):
+    """Общий для всех процессов лимит запросов к внешнему API"""
+    if shared_store is None:
+        return True
+    return await asyncio.to_thread(shared_store.take_token, name, rate, API_BURST)
+
+async def get_weather(city):
     """Получает температуру"""
+    cache_key = f"weather:{city.lower().strip()}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    if not await api_allowed('weather_api', WEATHER_API_RATE):
+        logger.warning("Лимит запросов погоды исчерпан")
+        return {'success': False, 'temperature': 20}
+
     try:
         params = {'q': city, 'appid': WEATHER_API_KEY, 'units': 'metric', 'lang': 'ru'}
-        response = requests.get(WEATHER_API_URL, params=params, timeout=5)
+        response = await http_client.get(WEATHER_API_URL, params=params)
         if response.status_code == 200:
-            return {'success': True, 'temperature': response.json()['main']['temp']}
+            weather = {'success': True, 'temperature': response.json()['main']['temp']}
+            await cache_set(cache_key, weather, WEATHER_CACHE_TTL)
+            return weather
     except Exception as e:
         logger.error(f"Ошибка погоды: {e}")
     return {'success': False, 'temperature': 20}
@@ -117,8 +219,8 @@ def calculate_calorie_goal(weight, height, age, gender, activity_minutes):
     bmr += 5 if gender.lower() in ['м', 'male', 'муж'] else -161
     return int(bmr + (activity_minutes / 30) * 150)
 
-def get_food_info(product_name):
-    """Ищет еду в базе или через API"""
+async def get_food_info(product_name):
+    """Ищет еду в базе, в кэше или через API"""
     product_lower = product_name.lower().strip()
     
     # Проверяем локальную базу
@@ -126,30 +228,50 @@ def get_food_info(product_name):
         food = COMMON_FOODS[product_lower]
         return {'success': True, 'name': food['name'], 'calories': food['calories']}
     
+    # Проверяем кэш
+    cache_key = f"food:{product_lower}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     # Пробуем API
-    try:
-        url = "https://world.openfoodfacts.org/cgi/search.pl"
-        params = {'search_terms': product_name, 'json': True, 'page_size': 1}
-        response = requests.get(url, params=params, timeout=5)
-        if response.status_code == 200:
-            products = response.json().get('products', [])
-            if products:
-                p = products[0]
-                calories = p.get('nutriments', {}).get('energy-kcal_100g', 0)
-                if calories > 0:
-                    return {
-                        'success': True,
-                        'name': p.get('product_name', product_name),
-                        'calories': calories
-                    }
-    except Exception as e:
-        logger.error(f"Ошибка API: {e}")
+    if await api_allowed('food_api', FOOD_API_RATE):
+        try:
+            params = {'search_terms': product_name, 'json': 1, 'page_size': 1}
+            response = await http_client.get(FOOD_API_URL, params=params)
+            if response.status_code == 200:
+                products = response.json().get('products', [])
+                if products:
+                    p = products[0]
+                    calories = p.get('nutriments', {}).get('energy-kcal_100g', 0)
+                    if calories > 0:
+                        food = {
+                            'success': True,
+                            'name': p.get('product_name', product_name),
+                            'calories': calories
+                        }
+                        await cache_set(cache_key, food, FOOD_CACHE_TTL)
+                        return food
+        except Exception as e:
+            logger.error(f"Ошибка API: {e}")
+    else:
+        logger.warning("Лимит запросов к API продуктов исчерпан")
     
     # Ищем похожие
     similar = [key for key in COMMON_FOODS.keys() 
                if product_lower in key or key in product_lower]
     return {'success': False, 'similar': similar[:5]}
 
+def add_history(user, entry_type, name, amount, calories=0):
+    """Добавляет запись в историю пользователя"""
+    user.setdefault('history', []).append({
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'type': entry_type,
+        'name': name,
+        'amount': amount,
+        'calories': round(calories, 1)
+    })
+
 # КОМАНДЫ
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -172,7 +294,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/log_water 500\n"
         "/log_food банан\n"
         "/log_workout бег 30\n"
-        "/check_progress"
+        "/check_progress\n"
+        "/export csv"
     )
 
 # НАСТРОЙКА ПРОФИЛЯ
@@ -182,6 +305,7 @@ async def set_profile_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return WEIGHT
 
 async def get_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     try:
         weight = float(update.message.text)
         if not (0 < weight <= 300):
@@ -200,6 +324,7 @@ async def get_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WEIGHT
 
 async def get_height(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     try:
         height = float(update.message.text)
         if not (0 < height <= 250):
@@ -213,6 +338,7 @@ async def get_height(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return HEIGHT
 
 async def get_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     try:
         age = int(update.message.text)
         if not (0 < age <= 120):
@@ -226,6 +352,7 @@ async def get_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return AGE
 
 async def get_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     text = update.message.text.lower()
     if text in ['м', 'муж', 'мужской', 'male', 'm']:
         gender = 'М'
@@ -239,6 +366,7 @@ async def get_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ACTIVITY
 
 async def get_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     try:
         activity = int(update.message.text)
         if not (0 <= activity <= 1440):
@@ -253,6 +381,7 @@ async def get_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Введи число:")
         return ACTIVITY
 async def get_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     user_id = update.effective_user.id
     city = update.message.text.strip()
     users_data[user_id]['city'] = city
@@ -260,7 +389,7 @@ async def get_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Уведомляем что проверяем погоду
     await update.message.reply_text(f"🔍 Проверяю актуальную погоду в {city}...")
     
-    weather = get_weather(city)
+    weather = await get_weather(city)
     temp = weather['temperature']
     users_data[user_id]['temperature'] = temp
     
@@ -319,6 +448,7 @@ async def cancel_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ЛОГИРОВАНИЕ ВОДЫ
 
 async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     user_id = update.effective_user.id
     if user_id not in users_data or 'water_goal' not in users_data[user_id]:
         await update.message.reply_text("❌ Сначала настрой профиль")
@@ -335,6 +465,7 @@ async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         users_data[user_id]['logged_water'] += amount
+        add_history(users_data[user_id], 'water', '', amount)
         total = users_data[user_id]['logged_water']
         goal = users_data[user_id]['water_goal']
         remaining = goal - total
@@ -356,6 +487,7 @@ async def log_water(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ЛОГИРОВАНИЕ ЕДЫ
 
 async def log_food_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     user_id = update.effective_user.id
     if user_id not in users_data or 'calorie_goal' not in users_data[user_id]:
         await update.message.reply_text("❌ Сначала настрой профиль")
@@ -368,7 +500,7 @@ async def log_food_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     product = ' '.join(context.args)
     await update.message.reply_text(f"🔍 Ищу: {product}...")
     
-    food = get_food_info(product)
+    food = await get_food_info(product)
     
     if not food['success']:
         similar = food.get('similar', [])
@@ -393,6 +525,7 @@ async def log_food_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return FOOD_AMOUNT
 
 async def get_food_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     try:
         amount = float(update.message.text)
         if not (0 < amount <= 10000):
@@ -404,6 +537,7 @@ async def get_food_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         user_id = update.effective_user.id
         users_data[user_id]['logged_calories'] += calories
+        add_history(users_data[user_id], 'food', food['name'], amount, calories)
         
         total = users_data[user_id]['logged_calories']
         burned = users_data[user_id]['burned_calories']
@@ -430,6 +564,7 @@ async def cancel_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ЛОГИРОВАНИЕ ТРЕНИРОВОК
 
 async def log_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     user_id = update.effective_user.id
     if user_id not in users_data or 'calorie_goal' not in users_data[user_id]:
         await update.message.reply_text("❌ Сначала настрой профиль")
@@ -458,6 +593,7 @@ async def log_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
         extra_water = int((duration / 30) * 200)
         
         users_data[user_id]['burned_calories'] += burned
+        add_history(users_data[user_id], 'workout', workout_type, duration, burned)
         users_data[user_id]['water_goal'] += extra_water
         
         await update.message.reply_text(
@@ -472,6 +608,7 @@ async def log_workout(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ПРОГРЕСС
 
 async def check_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    users_data = context.bot_data['users_data']
     user_id = update.effective_user.id
     if user_id not in users_data or 'water_goal' not in users_data[user_id]:
         await update.message.reply_text("❌ Сначала настрой профиль")
@@ -579,6 +716,7 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает текстовый ввод от кнопок"""
+    users_data = context.bot_data['users_data']
     text = update.message.text
     waiting = context.user_data.get('waiting_for')
     user_id = update.effective_user.id
@@ -591,6 +729,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
             
             users_data[user_id]['logged_water'] += amount
+            add_history(users_data[user_id], 'water', '', amount)
             total = users_data[user_id]['logged_water']
             goal = users_data[user_id]['water_goal']
             remaining = goal - total
@@ -614,7 +753,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         product = text.strip()
         await update.message.reply_text(f"🔍 Ищу: {product}...")
         
-        food = get_food_info(product)
+        food = await get_food_info(product)
         
         if not food['success']:
             similar = food.get('similar', [])
@@ -650,6 +789,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
             calories = (food['calories'] / 100) * amount
             
             users_data[user_id]['logged_calories'] += calories
+            add_history(users_data[user_id], 'food', food['name'], amount, calories)
             total = users_data[user_id]['logged_calories']
             burned = users_data[user_id]['burned_calories']
             goal = users_data[user_id]['calorie_goal']
@@ -686,6 +826,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 extra_water = int((duration / 30) * 200)
                 
                 users_data[user_id]['burned_calories'] += burned
+                add_history(users_data[user_id], 'workout', workout_type, duration, burned)
                 users_data[user_id]['water_goal'] += extra_water
                 
                 await update.message.reply_text(
@@ -702,10 +843,487 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("Используй кнопки", reply_markup=get_main_keyboard())
 
+# ЭКСПОРТ И ИМПОРТ ИСТОРИИ
+
+def write_export(user_id, history, fmt):
+    """Пишет историю во временный файл построчно, не собирая его в памяти"""
+    import csv
+    import tempfile
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='',
+                                     suffix=f".{EXPORT_FORMATS[fmt]}", delete=False) as out:
+        if fmt == 'csv':
+            writer = csv.DictWriter(out, fieldnames=HISTORY_FIELDS)
+            writer.writeheader()
+            for entry in history:
+                writer.writerow({'user_id': user_id, **entry})
+        else:
+            for entry in history:
+                out.write(json.dumps({'user_id': user_id, **entry}, ensure_ascii=False) + "\n")
+    return out.name
+
+def parse_import_row(row):
+    """Проверяет строку импорта, возвращает (user_id, запись) или None"""
+    try:
+        entry_type = row['type']
+        if entry_type not in HISTORY_TYPES:
+            return None
+        return int(row['user_id']), {
+            'time': str(row['time']),
+            'type': entry_type,
+            'name': str(row.get('name') or ''),
+            'amount': float(row['amount']),
+            'calories': float(row.get('calories') or 0)
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def iter_import_rows(f, fmt):
+    """Сырые строки файла импорта; битая строка — None, чтение продолжается"""
+    import csv
+    if fmt == 'csv':
+        rows = csv.DictReader(f)
+        while True:
+            try:
+                yield next(rows)
+            except StopIteration:
+                return
+            except csv.Error:
+                yield None
+    else:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+def read_import_batches(path, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """Читает файл импорта по частям, выдаёт пачки (строки, число пропущенных)"""
+    with open(path, encoding='utf-8', newline='') as f:
+        batch, skipped = [], 0
+        for raw in iter_import_rows(f, fmt):
+            parsed = parse_import_row(raw) if raw is not None else None
+            if parsed is None:
+                skipped += 1
+                continue
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                yield batch, skipped
+                batch, skipped = [], 0
+        if batch or skipped:
+            yield batch, skipped
+
+def apply_import_batch(users_data, batch):
+    """Применяет пачку целиком: строки уже проверены, между ними нет await"""
+    for user_id, entry in batch:
+        users_data.setdefault(user_id, {}).setdefault('history', []).append(entry)
+
+async def export_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /export — выгрузка истории в CSV или JSON"""
+    users_data = context.bot_data['users_data']
+    user_id = update.effective_user.id
+    args = list(context.args or [])
+    fmt = 'csv'
+    if args and args[0].lower() in EXPORT_FORMATS:
+        fmt = args.pop(0).lower()
+
+    target_id = user_id
+    if args:
+        if user_id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Только для администраторов")
+            return
+        try:
+            target_id = int(args[0])
+        except ValueError:
+            await update.message.reply_text("❌ Формат: /export csv|json [user_id]")
+            return
+
+    # Копия списка в цикле событий: поток экспорта не должен видеть, как он меняется
+    history = list(users_data.get(target_id, {}).get('history') or ())
+    if not history:
+        await update.message.reply_text("📭 История пуста")
+        return
+
+    path = await asyncio.to_thread(write_export, target_id, history, fmt)
+    try:
+        with open(path, 'rb') as f:
+            await update.message.reply_document(
+                document=f,
+                filename=f"history_{target_id}.{EXPORT_FORMATS[fmt]}",
+                caption=f"📤 История: {len(history)} записей"
+            )
+    finally:
+        os.remove(path)
+
+async def import_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Импорт истории из CSV/JSON (файл с подписью /import, только для админов)"""
+    users_data = context.bot_data['users_data']
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Только для администраторов")
+        return
+
+    document = update.message.document
+    file_name = (document.file_name or '').lower()
+    if file_name.endswith('.csv'):
+        fmt = 'csv'
+    elif file_name.endswith(('.json', '.jsonl')):
+        fmt = 'json'
+    else:
+        await update.message.reply_text("❌ Нужен файл .csv или .jsonl")
+        return
+
+    import tempfile
+    await update.message.reply_text("📥 Импортирую...")
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    imported = skipped = 0
+    try:
+        tg_file = await document.get_file()
+        await tg_file.download_to_drive(path)
+
+        batches = read_import_batches(path, fmt)
+        try:
+            while True:
+                # Чтение и разбор файла — в потоке, применение — в цикле событий
+                result = await asyncio.to_thread(next, batches, None)
+                if result is None:
+                    break
+                batch, bad = result
+                apply_import_batch(users_data, batch)
+                imported += len(batch)
+                skipped += bad
+        finally:
+            batches.close()
+    except Exception as e:
+        logger.error(f"Ошибка импорта: {e}")
+        await update.message.reply_text(f"❌ Ошибка импорта после {imported} записей")
+        return
+    finally:
+        os.remove(path)
+
+    await update.message.reply_text(
+        f"✅ Импорт завершён\n\n"
+        f"• Загружено: {imported}\n"
+        f"• Пропущено: {skipped}"
+    )
+
+# КОНТРОЛЬ НАГРУЗКИ
+
+def is_cheap_update(update):
+    """Лёгкие команды (прогресс, помощь) обслуживаются вне общей очереди"""
+    message = getattr(update, 'effective_message', None)
+    text = (message.text or '') if message else ''
+    if text.startswith('/'):
+        return text.split(maxsplit=1)[0].split('@')[0] in CHEAP_COMMANDS
+    return text in CHEAP_BUTTONS
+
+class AdmissionProcessor(BaseUpdateProcessor):
+    """Допуск обновлений до того, как под них появится задача.
+
+    PTB отдаёт сюда обновления по одному (max_concurrent_updates=1), и решение
+    принимается сразу: запустить, поставить в ограниченную очередь или отбросить.
+    Задач в работе не больше MAX_ACTIVE + CHEAP_RESERVE, ожидающих — не больше
+    MAX_WAITING и MAX_USER_PENDING на пользователя.
+    """
+
+    def __init__(self):
+        super().__init__(max_concurrent_updates=1)
+        self.buckets = {}          # user_id -> (токены, время пополнения)
+        self.shed_notices = {}     # user_id -> когда последний раз писали "попробуй позже"
+        self.notice_bucket = (SHED_NOTICE_BURST, time.monotonic())
+        self.swept_at = time.monotonic()
+        self.user_busy = set()     # у пользователя обновление в работе или в очереди за слотом
+        self.user_queues = {}      # user_id -> следующие обновления пользователя, по порядку
+        self.heavy_queue = deque() # тяжёлые обновления, ждущие свободный слот
+        self.active_heavy = 0
+        self.active_cheap = 0
+        self.pending = 0           # принятые и ещё не завершённые обновления
+        self.tasks = set()
+        self.metrics = {'admitted': 0, 'delayed': 0, 'dropped_rate': 0, 'dropped_overload': 0}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        await self.drain()
+
+    async def drain(self):
+        """Доделывает принятые обновления: работающие и ждущие в очередях.
+        Application.stop() их не ждёт — задачи создаём мы, а не PTB"""
+        while self.tasks or self.heavy_queue or self.user_queues:
+            if not self.tasks:
+                # Очереди без работающих задач не бывает, но и висеть здесь нельзя
+                self.fill_heavy_slots()
+                if not self.tasks:
+                    break
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, 'effective_user', None)
+        user_id = user.id if user else None
+        job = (update, coroutine, user_id, not is_cheap_update(update), time.monotonic())
+        self.pending += 1
+        self.fill_heavy_slots()
+        if job[4] - self.swept_at >= SWEEP_INTERVAL:
+            self.sweep(job[4])
+
+        if user_id is not None and not self.take_token(user_id, job[4]):
+            self.shed(job, 'dropped_rate')
+        elif user_id in self.user_busy:
+            # Порядок сообщений пользователя: ждёт, пока закончится предыдущее
+            queue = self.user_queues.setdefault(user_id, deque())
+            if len(queue) + 1 >= MAX_USER_PENDING:
+                self.shed(job, 'dropped_overload')
+            else:
+                queue.append(job)
+                self.metrics['delayed'] += 1
+        else:
+            self.dispatch(job)
+
+    def take_token(self, user_id, now):
+        """Корзина токенов: USER_RATE в секунду, не больше USER_BURST"""
+        tokens, last = self.buckets.get(user_id, (USER_BURST, now))
+        tokens = min(USER_BURST, tokens + (now - last) * USER_RATE)
+        if tokens < 1:
+            self.buckets[user_id] = (tokens, now)
+            return False
+        self.buckets[user_id] = (tokens - 1, now)
+        return True
+
+    def sweep(self, now):
+        """Забывает полные корзины и истёкшие отметки — они ничего не ограничивают"""
+        self.buckets = {
+            user_id: (tokens, last) for user_id, (tokens, last) in self.buckets.items()
+            if tokens + (now - last) * USER_RATE < USER_BURST
+        }
+        self.shed_notices = {
+            user_id: sent for user_id, sent in self.shed_notices.items()
+            if now - sent < SHED_NOTICE_INTERVAL
+        }
+        self.swept_at = now
+
+    def dispatch(self, job):
+        """Запускает обновление свободного пользователя или ставит в очередь за слотом"""
+        user_id, heavy = job[2], job[3]
+        if not heavy:
+            if self.active_cheap < CHEAP_RESERVE:
+                self.start(job)
+            else:
+                self.shed(job, 'dropped_overload')
+        elif self.active_heavy < MAX_ACTIVE:
+            self.start(job)
+        elif len(self.heavy_queue) < MAX_WAITING:
+            self.heavy_queue.append(job)
+            self.metrics['delayed'] += 1
+            if user_id is not None:
+                self.user_busy.add(user_id)
+        else:
+            self.shed(job, 'dropped_overload')
+
+    def fill_heavy_slots(self):
+        """Отбрасывает переждавшие MAX_WAIT_SECONDS и занимает освободившиеся слоты"""
+        now = time.monotonic()
+        while self.heavy_queue and now - self.heavy_queue[0][4] > MAX_WAIT_SECONDS:
+            job = self.heavy_queue.popleft()
+            self.shed(job, 'dropped_overload')
+            self.user_done(job[2])
+        while self.heavy_queue and self.active_heavy < MAX_ACTIVE:
+            self.start(self.heavy_queue.popleft())
+
+    def start(self, job):
+        user_id, heavy = job[2], job[3]
+        if heavy:
+            self.active_heavy += 1
+        else:
+            self.active_cheap += 1
+        if user_id is not None:
+            self.user_busy.add(user_id)
+        self.metrics['admitted'] += 1
+        self.track(asyncio.create_task(self.run(job)))
+
+    async def run(self, job):
+        try:
+            await job[1]
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления: {e}")
+        finally:
+            if job[3]:
+                self.active_heavy -= 1
+            else:
+                self.active_cheap -= 1
+            self.pending -= 1
+            self.user_done(job[2])
+            self.fill_heavy_slots()
+
+    def user_done(self, user_id):
+        """Пользователь освободился — запускаем его следующее обновление"""
+        if user_id is None:
+            return
+        self.user_busy.discard(user_id)
+        queue = self.user_queues.get(user_id)
+        while queue and user_id not in self.user_busy:
+            self.dispatch(queue.popleft())
+        if queue is not None and not queue:
+            del self.user_queues[user_id]
+
+    def shed(self, job, reason):
+        """Отбрасывает обновление, пользователю отвечаем не чаще SHED_NOTICE_INTERVAL"""
+        update, coroutine, user_id = job[0], job[1], job[2]
+        coroutine.close()
+        self.pending -= 1
+        self.metrics[reason] += 1
+
+        message = getattr(update, 'effective_message', None)
+        now = time.monotonic()
+        if message is None or now - self.shed_notices.get(user_id, -SHED_NOTICE_INTERVAL) < SHED_NOTICE_INTERVAL:
+            return
+        # Общий лимит: при наводнении не отвечаем каждому новому пользователю
+        tokens, last = self.notice_bucket
+        tokens = min(SHED_NOTICE_BURST, tokens + (now - last) * SHED_NOTICE_RATE)
+        if tokens < 1:
+            self.notice_bucket = (tokens, now)
+            return
+        self.notice_bucket = (tokens - 1, now)
+        self.shed_notices[user_id] = now
+        self.track(asyncio.create_task(self.send_shed_notice(message)))
+
+    async def send_shed_notice(self, message):
+        try:
+            await message.reply_text("⏳ Слишком много запросов, попробуй позже")
+        except Exception as e:
+            logger.error(f"Ошибка ответа при перегрузке: {e}")
+
+    def track(self, task):
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def metrics_text(self):
+        m = self.metrics
+        return (
+            f"📈 Нагрузка\n\n"
+            f"• Принято: {m['admitted']}\n"
+            f"• Отложено: {m['delayed']}\n"
+            f"• Отброшено (лимит пользователя): {m['dropped_rate']}\n"
+            f"• Отброшено (перегрузка): {m['dropped_overload']}\n"
+            f"• В работе: {self.active_heavy}/{MAX_ACTIVE}, лёгких: {self.active_cheap}, "
+            f"в очереди: {len(self.heavy_queue)}"
+        )
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /metrics — счётчики контроля нагрузки (только для админов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Только для администраторов")
+        return
+    await update.message.reply_text(context.bot_data['admission'].metrics_text())
+
+# БЫСТРЫЙ СТАРТ
+
+def load_snapshot(path):
+    """Загружает данные пользователей из бинарного снапшота.
+    Нет файла — пустые данные; испорченный файл — ошибка, иначе через
+    SNAPSHOT_INTERVAL его затрёт пустой снапшот"""
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка загрузки снапшота {path}: {e}")
+        raise
+
+def write_snapshot(payload, path):
+    """Атомарно записывает снапшот: сначала во временный файл, потом подмена"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+def copy_users(data):
+    """Копия для снапшота: словари пользователей и списки истории копируются,
+    сами записи истории после добавления не меняются и остаются общими"""
+    copy = {}
+    for user_id, user in data.items():
+        user = dict(user)
+        if 'history' in user:
+            user['history'] = list(user['history'])
+        copy[user_id] = user
+    return copy
+
+def dump_snapshot(data, path):
+    write_snapshot(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), path)
+
+async def save_snapshot(data, path):
+    # В цикле событий только быстрая копия, сериализация и запись — в потоке
+    await asyncio.to_thread(dump_snapshot, copy_users(data), path)
+
+async def warm_up(application: Application):
+    """Фоновый прогрев: бот уже принимает обновления, пока он идёт"""
+    started = time.perf_counter()
+    for module in WARM_UP_MODULES:
+        await asyncio.to_thread(__import__, module)
+    logger.info(f"🔥 Прогрев завершён за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await save_snapshot(
+                application.bot_data['users_data'], application.bot_data['snapshot_path']
+            )
+            if shared_store:
+                await asyncio.to_thread(shared_store.purge)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снапшота: {e}")
+
+async def post_init(application: Application):
+    timings = dict(startup_timings)
+    timings['сборка'] = application.bot_data['build_time']
+    timings['инициализация'] = time.perf_counter() - application.bot_data['built_at']
+    breakdown = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in timings.items())
+    logger.info(
+        f"⏱️ [{application.bot_data['bot_name']}] Старт за "
+        f"{(time.perf_counter() - BOOT_STARTED) * 1000:.0f} мс: {breakdown}"
+    )
+    acquire_http_client()
+    # Не application.create_task: такие задачи PTB ждёт при остановке
+    application.bot_data['warm_up'] = asyncio.create_task(warm_up(application))
+
+async def post_stop(application: Application):
+    # Между stop() и shutdown(): бот ещё может отвечать, доделываем принятое
+    await application.bot_data['admission'].drain()
+
+async def post_shutdown(application: Application):
+    warm_up_task = application.bot_data.get('warm_up')
+    if warm_up_task:
+        warm_up_task.cancel()
+    await save_snapshot(application.bot_data['users_data'], application.bot_data['snapshot_path'])
+    await release_http_client()
+
+def open_store():
+    """Открывает общее хранилище в текущем процессе"""
+    global shared_store
+    shared_store = SharedStore(SHARED_STORE_PATH)
+
 # ГЛАВНАЯ ФУНКЦИЯ
 
-def main():
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+def build_application(token, snapshot_path=DATA_SNAPSHOT_PATH, users=None, name='main'):
+    """Собирает Application со всеми обработчиками и своим хранилищем пользователей"""
+    started = time.perf_counter()
+    admission = AdmissionProcessor()
+    application = (
+        Application.builder()
+        .token(token)
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+        .concurrent_updates(admission)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.bot_data['admission'] = admission
+    application.bot_data['snapshot_path'] = snapshot_path
+    application.bot_data['users_data'] = users if users is not None else {}
+    application.bot_data['bot_name'] = name
     
     profile_conv = ConversationHandler(
         entry_points=[
@@ -736,6 +1354,12 @@ def main():
     application.add_handler(CommandHandler("log_water", log_water))
     application.add_handler(CommandHandler("log_workout", log_workout))
     application.add_handler(CommandHandler("check_progress", check_progress))
+    application.add_handler(CommandHandler("export", export_history))
+    application.add_handler(CommandHandler("metrics", metrics_command))
+    application.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/import"),
+        import_history
+    ))
     application.add_handler(MessageHandler(
         filters.Regex("^(💧 Записать воду|🍴 Записать еду|🏃 Записать тренировку|📊 Мой прогресс|❓ Помощь)$"),
         handle_buttons
@@ -743,10 +1367,41 @@ def main():
     application.add_handler(profile_conv)
     application.add_handler(food_conv)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
-    
+    application.bot_data['built_at'] = time.perf_counter()
+    application.bot_data['build_time'] = application.bot_data['built_at'] - started
+    return application
+
+def main():
+    startup_timings['импорты'] = IMPORTS_DONE - BOOT_STARTED
+
+    if len(BOT_TOKENS) > 1:
+        from multibot import run_multi
+        run_multi(BOT_TOKENS)
+        return
+
+    # Один бот: из BOT_TOKENS, по умолчанию там TELEGRAM_TOKEN под именем main
+    from multibot import bot_snapshot_path
+    name, token = next(iter(BOT_TOKENS.items()))
+    snapshot_path = bot_snapshot_path(DATA_SNAPSHOT_PATH, name)
+
+    if BOT_WORKERS > 1:
+        from sharding import run_sharded
+        run_sharded(token, BOT_WORKERS, snapshot_path)
+        return
+
+    started = time.perf_counter()
+    from sharding import merge_shards
+    merge_shards(snapshot_path)
+    users = load_snapshot(snapshot_path)
+    open_store()
+    startup_timings['снапшот'] = time.perf_counter() - started
+
+    application = build_application(token, snapshot_path, users, name)
     logger.info("🚀 Бот запущен!")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
+    # multibot и sharding делают import bot — пусть это будет этот же модуль
+    sys.modules.setdefault('bot', sys.modules[__name__])
     main()
 
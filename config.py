@@ -7,6 +7,16 @@ load_dotenv()
 # Токен Telegram бота
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
+# Несколько ботов в одном процессе: BOT_TOKENS=brand1=токен1,brand2=токен2
+# (режим BOT_WORKERS > 1 работает только с одним ботом)
+BOT_TOKENS = {}
+for item in os.getenv('BOT_TOKENS', '').split(','):
+    if '=' in item:
+        name, token = item.split('=', 1)
+        BOT_TOKENS[name.strip()] = token.strip()
+if not BOT_TOKENS:
+    BOT_TOKENS = {'main': TELEGRAM_TOKEN}
+
 # API ключ для погоды
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
 
@@ -15,3 +25,15 @@ WEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
 
 # URL для API продуктов
 FOOD_API_URL = "https://world.openfoodfacts.org/cgi/search.pl"
+
+# ID администраторов (через запятую) — импорт и выгрузка чужой истории
+ADMIN_IDS = {int(x) for x in os.getenv('ADMIN_IDS', '').replace(',', ' ').split()}
+
+# Файл снапшота данных пользователей (загружается при старте вместо пустой базы)
+DATA_SNAPSHOT_PATH = os.getenv('DATA_SNAPSHOT_PATH', 'users_data.pickle')
+
+# Число процессов-обработчиков (1 — обычный режим с run_polling)
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+
+# Общее хранилище процессов: кэш погоды/продуктов и лимиты внешних API
+SHARED_STORE_PATH = os.getenv('SHARED_STORE_PATH', 'shared_store.sqlite3')
@@ -0,0 +1,205 @@
+"""
+Несколько ботов (BOT_TOKENS) в одном процессе: у каждого свой Application
+и свои пользователи, общие — пул HTTP, кэш погоды и продуктов, база продуктов
+"""
+
+import asyncio
+import logging
+import os
+import signal
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+
+import bot as health_bot
+from config import ADMIN_IDS, DATA_SNAPSHOT_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def bot_snapshot_path(base_path, name):
+    # Бот по умолчанию (только TELEGRAM_TOKEN) хранит данные в общем снапшоте
+    if name == 'main':
+        return base_path
+    root, ext = os.path.splitext(base_path)
+    return f"{root}.{name}{ext}"
+
+
+async def close_requests(application):
+    """Закрывает HTTP-клиенты бота, если initialize() упал (например, на get_me
+    с отозванным токеном): Application.shutdown() и Bot.shutdown() считают такой
+    бот не запущенным и ничего не закрывают"""
+    await asyncio.gather(
+        *(request.shutdown() for request in application.bot._request), return_exceptions=True
+    )
+
+
+class BotHost:
+    """Запускает и останавливает ботов независимо друг от друга"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.applications = {}
+        self.starting = set()
+        self.stopping = set()
+        self.tasks = set()
+
+    async def start_bot(self, name):
+        # Имя занимаем до первого await: два /bot_start подряд не запустят бота дважды
+        if name in self.applications or name in self.starting:
+            return False
+        self.starting.add(name)
+        try:
+            path = bot_snapshot_path(DATA_SNAPSHOT_PATH, name)
+            application = health_bot.build_application(
+                self.tokens[name], path, health_bot.load_snapshot(path), name
+            )
+            application.bot_data['host'] = self
+            add_host_handlers(application)
+
+            try:
+                await application.initialize()
+            except Exception:
+                await close_requests(application)
+                raise
+            try:
+                await application.post_init(application)
+                await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                await application.start()
+            except Exception:
+                if application.updater.running:
+                    await application.updater.stop()
+                await application.shutdown()
+                await application.post_shutdown(application)
+                raise
+            self.applications[name] = application
+        finally:
+            self.starting.discard(name)
+        logger.info(f"🚀 Бот {name} запущен")
+        return True
+
+    async def stop_bot(self, name):
+        application = self.applications.get(name)
+        if application is None or name in self.stopping:
+            return False
+        self.stopping.add(name)
+        try:
+            await application.updater.stop()
+            await application.stop()
+            await application.post_stop(application)
+        except Exception as e:
+            logger.error(f"Ошибка остановки бота {name}: {e}")
+            raise
+        finally:
+            self.stopping.discard(name)
+        # Убираем из списка, только когда бот точно перестал получать обновления:
+        # иначе он работал бы дальше, невидимый для /bots и stop_all
+        del self.applications[name]
+        await application.shutdown()
+        await application.post_shutdown(application)
+        logger.info(f"Бот {name} остановлен")
+        return True
+
+    async def stop_all(self):
+        """Остановка процесса: сначала доводим начатые /bot_stop до сохранения снапшота"""
+        while self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        for name in list(self.applications):
+            try:
+                await self.stop_bot(name)
+            except Exception:
+                pass  # уже в логе, останавливаем остальных
+
+    def status_text(self):
+        lines = ["🤖 Боты\n"]
+        for name in self.tokens:
+            application = self.applications.get(name)
+            if application is None:
+                lines.append(f"⏹ {name}: остановлен")
+                continue
+            m = application.bot_data['admission'].metrics
+            lines.append(
+                f"▶️ {name}: пользователей {len(application.bot_data['users_data'])}, "
+                f"принято {m['admitted']}, отложено {m['delayed']}, "
+                f"отброшено {m['dropped_rate'] + m['dropped_overload']}"
+            )
+        return "\n".join(lines)
+
+
+# КОМАНДЫ УПРАВЛЕНИЯ (только ADMIN_IDS, доступны в любом из ботов)
+
+async def bots_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /bots — состояние и метрики всех ботов процесса"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Только для администраторов")
+        return
+    await update.message.reply_text(context.bot_data['host'].status_text())
+
+
+async def bot_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /bot_start имя"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Только для администраторов")
+        return
+    host = context.bot_data['host']
+    if not context.args or context.args[0] not in host.tokens:
+        await update.message.reply_text(f"❌ Боты: {', '.join(host.tokens)}")
+        return
+    name = context.args[0]
+    try:
+        started = await host.start_bot(name)
+    except Exception as e:
+        logger.error(f"Ошибка запуска бота {name}: {e}")
+        await update.message.reply_text(f"❌ Не удалось запустить {name}")
+        return
+    await update.message.reply_text(f"▶️ {name} запущен" if started else f"ℹ️ {name} уже работает")
+
+
+async def bot_stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /bot_stop имя"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Только для администраторов")
+        return
+    host = context.bot_data['host']
+    if not context.args or context.args[0] not in host.applications:
+        await update.message.reply_text(f"❌ Работают: {', '.join(host.applications)}")
+        return
+    # Остановка ждёт завершения текущих обработчиков, в том числе этого —
+    # поэтому запускаем её отдельной задачей
+    task = asyncio.create_task(host.stop_bot(context.args[0]))
+    host.tasks.add(task)
+    task.add_done_callback(host.tasks.discard)
+    await update.message.reply_text(f"⏹ Останавливаю {context.args[0]}")
+
+
+def add_host_handlers(application: Application):
+    application.add_handler(CommandHandler("bots", bots_command))
+    application.add_handler(CommandHandler("bot_start", bot_start_command))
+    application.add_handler(CommandHandler("bot_stop", bot_stop_command))
+
+
+# ЗАПУСК
+
+async def host_main(tokens):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    host = BotHost(tokens)
+    for name in tokens:
+        try:
+            await host.start_bot(name)
+        except Exception as e:
+            # Один неисправный токен не мешает остальным ботам
+            logger.error(f"Ошибка запуска бота {name}: {e}")
+
+    await stop.wait()
+    await host.stop_all()
+
+
+def run_multi(tokens):
+    """Режим нескольких ботов: в BOT_TOKENS больше одного токена"""
+    health_bot.open_store()
+    logger.info(f"🚀 Запускаю ботов: {', '.join(tokens)}")
+    asyncio.run(host_main(tokens))
@@ -0,0 +1,226 @@
+"""
+Шардирование по user_id: один приёмник обновлений (getUpdates)
+и N процессов-обработчиков, у каждого свой шард пользователей
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+
+from telegram import Bot, Update
+
+logger = logging.getLogger(__name__)
+
+SHARD_QUEUE_SIZE = 1000    # обновлений в очереди одного процесса
+POLL_TIMEOUT = 10          # long polling getUpdates (сек)
+WORKER_JOIN_TIMEOUT = 30   # сколько ждём остановки процесса (сек)
+
+
+def shard_for(user_id, workers):
+    """Номер процесса для пользователя — не зависит от перезапусков"""
+    return user_id % workers
+
+
+def shard_snapshot_path(base_path, shard, workers):
+    # Число процессов в имени: при смене BOT_WORKERS новые шарды не затирают старые
+    root, ext = os.path.splitext(base_path)
+    return f"{root}.shard{shard}of{workers}{ext}"
+
+
+def shard_meta_path(base_path):
+    root, _ = os.path.splitext(base_path)
+    return f"{root}.shards.json"
+
+
+def read_shard_workers(base_path):
+    """Сколько процессов записали текущие шарды; 0 — данные в общем снапшоте"""
+    try:
+        with open(shard_meta_path(base_path), encoding='utf-8') as f:
+            return json.load(f)['workers']
+    except FileNotFoundError:
+        return 0
+
+
+def write_shard_workers(base_path, workers):
+    path = shard_meta_path(base_path)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'workers': workers}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_all_users(base_path):
+    """Все пользователи: из текущих шардов, а если их нет — из общего снапшота.
+    Испорченный файл — ошибка: иначе пользователи молча потеряются при раскладке"""
+    workers = read_shard_workers(base_path)
+    paths = [shard_snapshot_path(base_path, shard, workers) for shard in range(workers)]
+    import bot as health_bot
+    data = {}
+    for path in paths or [base_path]:
+        data.update(health_bot.load_snapshot(path))
+    return data
+
+
+def remove_shards(base_path, workers):
+    for shard in range(workers):
+        try:
+            os.remove(shard_snapshot_path(base_path, shard, workers))
+        except FileNotFoundError:
+            pass
+
+
+def repartition(base_path, workers):
+    """Раскладывает пользователей по шардам, если BOT_WORKERS изменилось.
+    Новые шарды пишутся рядом со старыми, переключение — запись числа процессов"""
+    import bot as health_bot
+    old_workers = read_shard_workers(base_path)
+    if old_workers == workers:
+        return
+    shards = [{} for _ in range(workers)]
+    for user_id, user in load_all_users(base_path).items():
+        shards[shard_for(user_id, workers)][user_id] = user
+    for shard, users in enumerate(shards):
+        health_bot.dump_snapshot(users, shard_snapshot_path(base_path, shard, workers))
+    write_shard_workers(base_path, workers)
+    remove_shards(base_path, old_workers)
+    logger.info(f"Пользователи разложены по {workers} шардам (было {old_workers or 'без шардов'})")
+
+
+def merge_shards(base_path):
+    """Возврат к одному процессу: шарды сливаются обратно в общий снапшот"""
+    import bot as health_bot
+    old_workers = read_shard_workers(base_path)
+    if not old_workers:
+        return
+    health_bot.dump_snapshot(load_all_users(base_path), base_path)
+    os.remove(shard_meta_path(base_path))
+    remove_shards(base_path, old_workers)
+    logger.info(f"{old_workers} шардов слиты в общий снапшот")
+
+
+# ПРОЦЕСС-ОБРАБОТЧИК
+
+async def worker_loop(application, queue):
+    """Передаёт обновления из очереди шарда в обычные обработчики бота.
+    Забираем всё сразу: лишнее отбросит AdmissionProcessor, а не очередь шарда"""
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        while True:
+            payload = await asyncio.to_thread(queue.get)
+            if payload is None:
+                break
+            update = Update.de_json(json.loads(payload), application.bot)
+            await application.update_queue.put(update)
+        await application.stop()
+        await application.post_stop(application)
+    await application.post_shutdown(application)
+
+
+def run_worker(token, base_path, shard, workers, queue):
+    # Остановкой управляет приёмник через очередь, Ctrl+C здесь не нужен
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import bot as health_bot
+
+    path = shard_snapshot_path(base_path, shard, workers)
+    users = health_bot.load_snapshot(path)
+    health_bot.open_store()
+    application = health_bot.build_application(token, path, users, f"shard{shard}")
+    logger.info(f"🚀 Шард {shard}/{workers} запущен, пользователей: {len(users)}")
+    asyncio.run(worker_loop(application, queue))
+
+
+def start_worker(ctx, token, base_path, shard, workers, queue):
+    process = ctx.Process(
+        target=run_worker, args=(token, base_path, shard, workers, queue),
+        name=f"bot-shard-{shard}", daemon=True
+    )
+    process.start()
+    return process
+
+
+# ПРИЁМНИК
+
+def route_update(update, queues, routed, dropped):
+    """Кладёт обновление в очередь его шарда. Не ждёт: заполненная очередь
+    одного шарда не должна задерживать остальных — такое обновление отбрасываем"""
+    user = update.effective_user
+    shard = shard_for(user.id if user else 0, len(queues))
+    try:
+        queues[shard].put_nowait(json.dumps(update.to_dict()))
+        routed[shard] += 1
+    except queue_module.Full:
+        if not dropped[shard]:
+            logger.warning(f"Шард {shard} не успевает, обновления отбрасываются")
+        dropped[shard] += 1
+
+
+async def ingress(token, base_path, workers, queues, processes, ctx):
+    """Получает обновления и раскладывает их по процессам по user_id"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    routed = [0] * workers
+    dropped = [0] * workers
+    offset = None
+    async with Bot(token) as bot:
+        while not stop.is_set():
+            # Упавший процесс поднимаем с тем же номером и той же очередью
+            for shard, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning(f"Шард {shard} остановился (код {process.exitcode}), перезапускаю")
+                    processes[shard] = start_worker(ctx, token, base_path, shard, workers, queues[shard])
+
+            poll = asyncio.ensure_future(bot.get_updates(
+                offset=offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES
+            ))
+            stopped = asyncio.ensure_future(stop.wait())
+            await asyncio.wait({poll, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            if not poll.done():
+                poll.cancel()
+                break
+
+            try:
+                updates = poll.result()
+            except Exception as e:
+                logger.error(f"Ошибка getUpdates: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for update in updates:
+                route_update(update, queues, routed, dropped)
+                offset = update.update_id + 1
+
+        # Подтверждаем последнюю пачку, иначе после перезапуска Telegram пришлёт её снова
+        if offset is not None:
+            try:
+                await bot.get_updates(offset=offset, timeout=0, limit=1)
+            except Exception as e:
+                logger.error(f"Не удалось подтвердить обновления: {e}")
+
+    logger.info(f"Приёмник остановлен, обновлений по шардам: {routed}, отброшено: {dropped}")
+
+
+def run_sharded(token, workers, base_path):
+    """Режим нескольких процессов: BOT_WORKERS > 1"""
+    # До запуска процессов: шарды должны соответствовать текущему BOT_WORKERS
+    repartition(base_path, workers)
+    ctx = multiprocessing.get_context('spawn')
+    queues = [ctx.Queue(maxsize=SHARD_QUEUE_SIZE) for _ in range(workers)]
+    processes = [start_worker(ctx, token, base_path, shard, workers, queues[shard]) for shard in range(workers)]
+    logger.info(f"🚀 Приёмник запущен, процессов: {workers}")
+    try:
+        asyncio.run(ingress(token, base_path, workers, queues, processes, ctx))
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join(WORKER_JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
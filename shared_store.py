@@ -0,0 +1,72 @@
+"""
+Общее хранилище для процессов бота на одной машине (SQLite):
+кэш погоды и продуктов, лимиты на внешние API
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class SharedStore:
+    """Кэш с TTL и корзины токенов, общие для всех процессов"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+        )
+
+    def get(self, key):
+        """Значение из кэша или None, если его нет или оно устарело"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+            )
+
+    def take_token(self, name, rate, burst):
+        """Корзина токенов одна на все процессы: rate в секунду, не больше burst"""
+        with self.lock:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT tokens, updated FROM buckets WHERE name = ?", (name,)
+                ).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    (name, tokens, now)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return allowed
+
+    def purge(self):
+        """Удаляет устаревшие записи кэша"""
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,162 @@
+"""
+Тесты допуска обновлений под нагрузкой
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def make_update(user_id, text="банан"):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_message=FakeMessage(text))
+
+
+def test_flood_is_shed_and_cheap_command_still_runs():
+    async def scenario():
+        processor = bot.AdmissionProcessor()
+        gate = asyncio.Event()
+        done = []
+
+        async def heavy_handler():
+            await gate.wait()
+
+        async def cheap_handler():
+            done.append('progress')
+
+        flood = 200
+        for user_id in range(flood):
+            await processor.process_update(make_update(user_id), heavy_handler())
+
+        assert processor.active_heavy == bot.MAX_ACTIVE
+        assert len(processor.heavy_queue) == bot.MAX_WAITING
+        assert processor.metrics['dropped_overload'] == flood - bot.MAX_ACTIVE - bot.MAX_WAITING
+        assert processor.pending == bot.MAX_ACTIVE + bot.MAX_WAITING
+
+        await processor.process_update(make_update(10_000, "/check_progress"), cheap_handler())
+        await asyncio.sleep(0)
+        assert done == ['progress']
+
+        gate.set()
+        await processor.shutdown()
+        assert processor.pending == 0
+        assert processor.metrics['admitted'] == bot.MAX_ACTIVE + bot.MAX_WAITING + 1
+        assert not processor.user_busy and not processor.heavy_queue
+
+    asyncio.run(scenario())
+
+
+def test_spammer_is_limited_and_order_kept():
+    async def scenario():
+        processor = bot.AdmissionProcessor()
+        gate = asyncio.Event()
+        order = []
+
+        async def handler(i):
+            await gate.wait()
+            order.append(i)
+
+        updates = [make_update(1) for _ in range(10)]
+        for i, update in enumerate(updates):
+            await processor.process_update(update, handler(i))
+
+        # Одно в работе, одно ждёт своей очереди, остальные отброшены
+        assert processor.metrics['admitted'] == 1
+        assert processor.metrics['delayed'] == 1
+        assert processor.metrics['dropped_overload'] + processor.metrics['dropped_rate'] == 8
+
+        gate.set()
+        await processor.shutdown()
+        assert order == [0, 1]
+        replies = sum(len(update.effective_message.replies) for update in updates)
+        assert replies == 1
+
+    asyncio.run(scenario())
+
+
+def test_waiting_update_expires(monkeypatch):
+    monkeypatch.setattr(bot, 'MAX_ACTIVE', 1)
+    monkeypatch.setattr(bot, 'MAX_WAIT_SECONDS', 0)
+
+    async def scenario():
+        processor = bot.AdmissionProcessor()
+        ran = []
+
+        async def handler(i):
+            await asyncio.sleep(0.01)
+            ran.append(i)
+
+        await processor.process_update(make_update(1), handler(1))
+        await processor.process_update(make_update(2), handler(2))
+        await processor.shutdown()
+        assert ran == [1]
+        assert processor.metrics['dropped_overload'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_drain_finishes_queued_updates(monkeypatch):
+    monkeypatch.setattr(bot, 'MAX_ACTIVE', 1)
+
+    async def scenario():
+        processor = bot.AdmissionProcessor()
+        done = []
+
+        async def handler(i):
+            await asyncio.sleep(0.01)
+            done.append(i)
+
+        # Второе ждёт слот, третье — своё предыдущее сообщение
+        await processor.process_update(make_update(1), handler(1))
+        await processor.process_update(make_update(2), handler(2))
+        await processor.process_update(make_update(2), handler(3))
+        await processor.drain()
+        assert done == [1, 2, 3]
+        assert not processor.tasks and not processor.heavy_queue and not processor.user_queues
+
+    asyncio.run(scenario())
+
+
+def test_application_uses_admission_processor():
+    application = bot.build_application("123456:TEST")
+    assert isinstance(application.update_processor, bot.AdmissionProcessor)
+    assert application.update_processor is application.bot_data['admission']
+    assert application.update_queue.maxsize == bot.UPDATE_QUEUE_SIZE
+    assert application.post_stop is bot.post_stop
+
+
+def test_notices_capped_and_state_swept():
+    async def scenario():
+        processor = bot.AdmissionProcessor()
+        gate = asyncio.Event()
+
+        async def handler():
+            await gate.wait()
+
+        updates = [make_update(user_id) for user_id in range(200)]
+        for update in updates:
+            await processor.process_update(update, handler())
+        gate.set()
+        await processor.shutdown()
+        replies = sum(len(update.effective_message.replies) for update in updates)
+        assert replies == bot.SHED_NOTICE_BURST
+        assert len(processor.shed_notices) == bot.SHED_NOTICE_BURST
+        assert len(processor.buckets) == 200
+
+        # При чистке полные корзины и истёкшие отметки забываются
+        now = bot.time.monotonic()
+        processor.buckets[1] = (0, now + bot.SHED_NOTICE_INTERVAL)
+        processor.sweep(now + bot.SHED_NOTICE_INTERVAL)
+        assert set(processor.buckets) == {1}
+        assert not processor.shed_notices
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+"""
+Тесты импорта, истории и снапшота
+"""
+
+import json
+import os
+
+import pytest
+
+import bot
+
+
+def write_lines(tmp_path, name, lines):
+    path = tmp_path / name
+    path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    return str(path)
+
+
+def row(user_id, amount):
+    return {'user_id': user_id, 'time': '2026-01-01T10:00:00', 'type': 'water',
+            'name': '', 'amount': amount, 'calories': 0}
+
+
+def collect(path, fmt, batch_size=bot.IMPORT_BATCH_SIZE):
+    batches = list(bot.read_import_batches(path, fmt, batch_size))
+    rows = [item for batch, _ in batches for item in batch]
+    skipped = sum(bad for _, bad in batches)
+    return rows, skipped
+
+
+def test_json_malformed_middle_line_does_not_stop_import(tmp_path):
+    lines = [json.dumps(row(1, 100)), '{broken'] + [json.dumps(row(1, 200 + i)) for i in range(5)]
+    rows, skipped = collect(write_lines(tmp_path, 'h.jsonl', lines), 'json')
+    assert len(rows) == 6
+    assert skipped == 1
+    assert rows[-1] == (1, {'time': '2026-01-01T10:00:00', 'type': 'water', 'name': '',
+                            'amount': 204.0, 'calories': 0.0})
+
+
+def test_json_blank_lines_and_invalid_rows(tmp_path):
+    lines = [json.dumps(row(1, 100)), '', '[1, 2]', json.dumps({**row(2, 5), 'type': 'sleep'}),
+             json.dumps(row(2, 300))]
+    rows, skipped = collect(write_lines(tmp_path, 'h.jsonl', lines), 'json')
+    assert [user_id for user_id, _ in rows] == [1, 2]
+    assert skipped == 2
+
+
+def test_csv_batches(tmp_path):
+    header = ','.join(bot.HISTORY_FIELDS)
+    lines = [header] + [f"{i},2026-01-01T10:00:00,food,Банан,150,133.5" for i in range(7)]
+    lines.insert(3, "x,2026-01-01T10:00:00,food,Банан,abc,1")
+    path = write_lines(tmp_path, 'h.csv', lines)
+    batches = list(bot.read_import_batches(path, 'csv', batch_size=3))
+    assert [len(batch) for batch, _ in batches] == [3, 3, 1]
+    assert sum(bad for _, bad in batches) == 1
+
+
+def test_export_import_round_trip(tmp_path):
+    user = {}
+    bot.add_history(user, 'workout', 'бег', 30, 300.04)
+    path = bot.write_export(42, user['history'], 'json')
+    rows, skipped = collect(path, 'json')
+    os.remove(path)
+    users_data = {}
+    bot.apply_import_batch(users_data, rows)
+    assert skipped == 0
+    assert users_data[42]['history'][0]['calories'] == 300.0
+    assert users_data[42]['history'][0]['name'] == 'бег'
+
+
+def test_import_keeps_live_history():
+    users_data = {1: {'history': [{'amount': 'live'}]}}
+    bot.apply_import_batch(users_data, [(1, {'amount': i}) for i in range(1500)])
+    history = users_data[1]['history']
+    assert len(history) == 1501 and history[0] == {'amount': 'live'}
+
+
+def test_snapshot_saved_from_copy(tmp_path):
+    data = {1: {'weight': 70, 'history': [{'amount': 1}]}}
+    path = str(tmp_path / "users.pickle")
+    copy = bot.copy_users(data)
+    data[1]['history'].append({'amount': 2})
+    data[1]['weight'] = 71
+    bot.dump_snapshot(copy, path)
+    assert bot.load_snapshot(path) == {1: {'weight': 70, 'history': [{'amount': 1}]}}
+
+
+def test_broken_snapshot_is_not_replaced_with_empty(tmp_path):
+    path = tmp_path / "users.pickle"
+    assert bot.load_snapshot(str(path)) == {}
+    path.write_bytes(b"not a pickle")
+    with pytest.raises(Exception):
+        bot.load_snapshot(str(path))
+    assert path.read_bytes() == b"not a pickle"
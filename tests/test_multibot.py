@@ -0,0 +1,129 @@
+"""
+Тесты запуска и остановки ботов в одном процессе
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import multibot
+
+
+class FakeUpdater:
+    async def start_polling(self, **kwargs):
+        await asyncio.sleep(0)
+
+    async def stop(self):
+        pass
+
+
+class FakeRequest:
+    def __init__(self):
+        self.closed = False
+
+    async def shutdown(self):
+        self.closed = True
+
+
+class FakeApplication:
+    fail = None
+
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+        self.bot_data = {}
+        self.updater = FakeUpdater()
+        self.bot = SimpleNamespace(_request=(FakeRequest(), FakeRequest()))
+
+    def add_handler(self, handler):
+        pass
+
+    async def initialize(self):
+        await asyncio.sleep(0)
+        if self.fail == 'initialize':
+            raise RuntimeError("токен отклонён")
+
+    async def post_init(self, application):
+        pass
+
+    async def start(self):
+        self.log.append(('start', self.name))
+
+    async def stop(self):
+        await asyncio.sleep(0.01)
+        if self.fail == 'stop':
+            raise RuntimeError("не остановился")
+
+    async def post_stop(self, application):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def post_shutdown(self, application):
+        self.log.append(('saved', self.name))
+
+
+def fake_host(monkeypatch, names, fail=None):
+    log = []
+    built = []
+
+    def build_application(token, path, users, name):
+        application = FakeApplication(log, name)
+        application.fail = fail
+        built.append(application)
+        return application
+
+    monkeypatch.setattr(multibot.health_bot, 'load_snapshot', lambda path: {})
+    monkeypatch.setattr(multibot.health_bot, 'build_application', build_application)
+    host = multibot.BotHost({name: f"token-{name}" for name in names})
+    host.built = built
+    return host, log
+
+
+def test_concurrent_start_runs_bot_once(monkeypatch):
+    host, log = fake_host(monkeypatch, ['brand1'])
+
+    async def scenario():
+        return await asyncio.gather(host.start_bot('brand1'), host.start_bot('brand1'))
+
+    assert sorted(asyncio.run(scenario())) == [False, True]
+    assert log == [('start', 'brand1')]
+    assert not host.starting
+
+
+def test_stop_all_waits_for_pending_stop(monkeypatch):
+    host, log = fake_host(monkeypatch, ['brand1', 'brand2'])
+
+    async def scenario():
+        await host.start_bot('brand1')
+        await host.start_bot('brand2')
+        task = asyncio.create_task(host.stop_bot('brand1'))
+        host.tasks.add(task)
+        task.add_done_callback(host.tasks.discard)
+        await host.stop_all()
+
+    asyncio.run(scenario())
+    assert ('saved', 'brand1') in log and ('saved', 'brand2') in log
+    assert not host.applications and not host.tasks
+
+
+def test_failed_initialize_closes_requests(monkeypatch):
+    host, log = fake_host(monkeypatch, ['brand1'], fail='initialize')
+    with pytest.raises(RuntimeError):
+        asyncio.run(host.start_bot('brand1'))
+    assert all(request.closed for request in host.built[0].bot._request)
+    assert not host.applications and not host.starting
+
+
+def test_failed_stop_keeps_bot_tracked(monkeypatch):
+    host, log = fake_host(monkeypatch, ['brand1'], fail='stop')
+
+    async def scenario():
+        await host.start_bot('brand1')
+        with pytest.raises(RuntimeError):
+            await host.stop_bot('brand1')
+
+    asyncio.run(scenario())
+    assert 'brand1' in host.applications and not host.stopping
@@ -0,0 +1,99 @@
+"""
+Тесты раскладки пользователей по шардам
+"""
+
+import asyncio
+import os
+import queue
+import signal
+from types import SimpleNamespace
+
+import bot
+import sharding
+
+
+def users(ids):
+    return {user_id: {'weight': 70, 'history': [{'amount': user_id}]} for user_id in ids}
+
+
+def test_repartition_keeps_every_user(tmp_path):
+    base = str(tmp_path / "users.pickle")
+    bot.dump_snapshot(users(range(10)), base)
+
+    sharding.repartition(base, 2)
+    assert sharding.read_shard_workers(base) == 2
+    shard1 = bot.load_snapshot(sharding.shard_snapshot_path(base, 1, 2))
+    assert set(shard1) == {1, 3, 5, 7, 9}
+
+    sharding.repartition(base, 3)
+    assert sharding.read_shard_workers(base) == 3
+    assert not os.path.exists(sharding.shard_snapshot_path(base, 0, 2))
+    for shard in range(3):
+        data = bot.load_snapshot(sharding.shard_snapshot_path(base, shard, 3))
+        assert all(sharding.shard_for(user_id, 3) == shard for user_id in data)
+    assert sharding.load_all_users(base) == users(range(10))
+
+
+def test_merge_back_to_one_process(tmp_path):
+    base = str(tmp_path / "users.pickle")
+    bot.dump_snapshot(users(range(4)), base)
+    sharding.repartition(base, 2)
+
+    # Шард успел поработать: его данные новее общего снапшота
+    bot.dump_snapshot(users([0, 2, 4]), sharding.shard_snapshot_path(base, 0, 2))
+    sharding.merge_shards(base)
+    assert sharding.read_shard_workers(base) == 0
+    assert bot.load_snapshot(base) == users([0, 1, 2, 3, 4])
+    assert not os.path.exists(sharding.shard_snapshot_path(base, 0, 2))
+
+
+def test_same_workers_left_alone(tmp_path):
+    base = str(tmp_path / "users.pickle")
+    sharding.repartition(base, 2)
+    path = sharding.shard_snapshot_path(base, 0, 2)
+    bot.dump_snapshot(users([0]), path)
+    sharding.repartition(base, 2)
+    assert bot.load_snapshot(path) == users([0])
+
+
+def test_full_shard_does_not_block_others():
+    queues = [queue.Queue(maxsize=1), queue.Queue(maxsize=1)]
+    routed, dropped = [0, 0], [0, 0]
+    for user_id in (0, 2, 4, 1):
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id),
+                                 to_dict=lambda user_id=user_id: {'user_id': user_id})
+        sharding.route_update(update, queues, routed, dropped)
+    assert routed == [1, 1] and dropped == [2, 0]
+    assert queues[1].get_nowait() == '{"user_id": 1}'
+
+
+def test_ingress_confirms_last_batch_on_stop(monkeypatch):
+    calls = []
+
+    class FakeBot:
+        def __init__(self, token):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            pass
+
+        async def get_updates(self, offset=None, timeout=None, **kwargs):
+            calls.append((offset, timeout))
+            if len(calls) == 1:
+                # Остановка приходит, пока пачка ещё не подтверждена
+                os.kill(os.getpid(), signal.SIGTERM)
+                return [SimpleNamespace(update_id=7, effective_user=SimpleNamespace(id=1),
+                                        to_dict=lambda: {'update_id': 7})]
+            if timeout:
+                await asyncio.sleep(10)
+            return []
+
+    monkeypatch.setattr(sharding, 'Bot', FakeBot)
+    process = SimpleNamespace(is_alive=lambda: True)
+    queues = [queue.Queue(), queue.Queue()]
+    asyncio.run(sharding.ingress("token", "users.pickle", 2, queues, [process, process], None))
+    assert calls[-1] == (8, 0)
+    assert queues[1].qsize() == 1